@@ -40,11 +40,11 @@ def pad(x: Tensor, pad: Iterable[int], value: float = 0.0, mode: str = "constant
     return _pad(input=x, pad=pad, value=value, mode=mode)  # type: ignore
 
 
-def interpolate(x: Tensor, factor: float | torch.Size, mode: str = "nearest") -> Tensor:
+def interpolate(x: Tensor, factor: float | torch.Size, mode: str = "nearest", antialias: bool = False) -> Tensor:
     return (
-        _interpolate(x, scale_factor=factor, mode=mode)
+        _interpolate(x, scale_factor=factor, mode=mode, antialias=antialias)
         if isinstance(factor, float | int)
-        else _interpolate(x, size=factor, mode=mode)
+        else _interpolate(x, size=factor, mode=mode, antialias=antialias)
     )  # type: ignore
 
 
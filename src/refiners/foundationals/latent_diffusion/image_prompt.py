@@ -1,6 +1,11 @@
 import math
-from typing import TYPE_CHECKING, Any, Generic, TypeVar, overload
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Generic, Literal, TypeVar, cast, overload
+from warnings import warn
 
+import numpy as np
+import torch
 from jaxtyping import Float
 from PIL import Image
 from torch import Tensor, cat, device as Device, dtype as DType, nn, softmax, tensor, zeros_like
@@ -8,8 +13,8 @@ from torch import Tensor, cat, device as Device, dtype as DType, nn, softmax, te
 import refiners.fluxion.layers as fl
 from refiners.fluxion.adapters.adapter import Adapter
 from refiners.fluxion.context import Contexts
-from refiners.fluxion.layers.attentions import ScaledDotProductAttention
-from refiners.fluxion.utils import image_to_tensor, normalize
+from refiners.fluxion.layers.attentions import ScaledDotProductAttention, scaled_dot_product_attention
+from refiners.fluxion.utils import interpolate, no_grad, normalize
 from refiners.foundationals.clip.image_encoder import CLIPImageEncoderH
 
 if TYPE_CHECKING:
@@ -18,6 +23,8 @@ if TYPE_CHECKING:
 
 T = TypeVar("T", bound="SD1UNet | SDXLUNet")
 TIPAdapter = TypeVar("TIPAdapter", bound="IPAdapter[Any]")  # Self (see PEP 673)
+TCrossAttentionAdapter = TypeVar("TCrossAttentionAdapter", bound="CrossAttentionAdapter")  # Self (see PEP 673)
+AttentionBackend = Literal["sdpa", "sage2"]
 
 
 class ImageProjection(fl.Chain):
@@ -233,9 +240,120 @@ class PerceiverResampler(fl.Chain):
         return {"perceiver_resampler": {"x": None}}
 
 
+@lru_cache()
+def load_sageattn() -> Callable[..., Tensor] | None:
+    """The `sageattn` function of the optional `sageattention` package, imported on first use (it loads Triton)."""
+    try:
+        from sageattention import sageattn  # type: ignore
+    except ImportError:
+        return None
+    return cast(Callable[..., Tensor], sageattn)
+
+
+def sage_dot_product_attention(query: Tensor, key: Tensor, value: Tensor, is_causal: bool = False) -> Tensor:
+    """SageAttention (INT8 quantized QK^T), falling back to PyTorch's SDPA when it cannot be used.
+
+    See [[arXiv:2411.10958] SageAttention2](https://arxiv.org/abs/2411.10958) for more details.
+
+    Note:
+        SageAttention only supports head dimensions of 64 and 128: other head dimensions (e.g. 40, 80 and 160 in
+        the SD1 U-Net) fall back to PyTorch's SDPA, with a warning (once per head dimension).
+    """
+    if not query.is_cuda or query.dtype not in (torch.float16, torch.bfloat16) or (sageattn := load_sageattn()) is None:
+        return scaled_dot_product_attention(query=query, key=key, value=value, is_causal=is_causal)
+    if (head_dim := query.shape[-1]) not in (64, 128):
+        warn_unsupported_head_dim(head_dim)
+        return scaled_dot_product_attention(query=query, key=key, value=value, is_causal=is_causal)
+    return sageattn(query, key, value, tensor_layout="HND", is_causal=is_causal)
+
+
+@lru_cache()
+def warn_unsupported_head_dim(head_dim: int) -> None:
+    warn(f"SageAttention does not support a head dimension of {head_dim}, falling back to PyTorch's SDPA")
+
+
+@lru_cache()
+def compiler_disabled_sage_dot_product_attention() -> Callable[..., Tensor]:
+    """`sage_dot_product_attention`, which dynamo must not trace into (it calls a CUDA extension).
+
+    Note:
+        Wrapped on first use rather than at import time, since `torch.compiler.disable` imports `torch._dynamo`.
+    """
+    return torch.compiler.disable(sage_dot_product_attention)  # type: ignore
+
+
+class SageAttention(ScaledDotProductAttention):
+    """Scaled Dot Product Attention computed with SageAttention (see `sage_dot_product_attention`).
+
+    Note:
+        Requires the optional `sageattention` package, `is_optimized`, and CUDA float16 or bfloat16 inputs with a head
+        dimension of 64 or 128. Otherwise, it behaves exactly like `ScaledDotProductAttention`.
+    """
+
+    def __init__(
+        self,
+        num_heads: int = 1,
+        is_causal: bool = False,
+        is_optimized: bool = True,
+        slice_size: int | None = None,
+    ) -> None:
+        super().__init__(num_heads=num_heads, is_causal=is_causal, is_optimized=is_optimized, slice_size=slice_size)
+        if is_optimized:
+            self.dot_product = compiler_disabled_sage_dot_product_attention()
+
+
+def tensor_version(x: Tensor) -> int | None:
+    """The version counter of a tensor (bumped by in-place operations), or None for an inference tensor.
+
+    Note:
+        Inference tensors (e.g. created under `torch.inference_mode`) do not track their version: a cache can then
+        only rely on the tensor's identity.
+    """
+    return None if x.is_inference() else x._version  # pyright: ignore[reportPrivateUsage]
+
+
+def make_attention(
+    backend: AttentionBackend,
+    num_heads: int = 1,
+    is_causal: bool = False,
+    is_optimized: bool = True,
+    slice_size: int | None = None,
+) -> ScaledDotProductAttention:
+    match backend:
+        case "sdpa":
+            return ScaledDotProductAttention(
+                num_heads=num_heads, is_causal=is_causal, is_optimized=is_optimized, slice_size=slice_size
+            )
+        case "sage2":
+            return SageAttention(
+                num_heads=num_heads, is_causal=is_causal, is_optimized=is_optimized, slice_size=slice_size
+            )
+
+
 class ImageCrossAttention(fl.Chain):
-    def __init__(self, text_cross_attention: fl.Attention, scale: float = 1.0) -> None:
+    """Image cross-attention, computed on the CLIP image embedding of the `ip_adapter` context.
+
+    Note:
+        Since attention is linear in the values, the scale is applied to the image values
+        (`SDPA(Q, K, scale * V) = scale * SDPA(Q, K, V)`) instead of multiplying the output at every step: outside of
+        autograd, it is folded into the cached values (see below). The projection weights are left untouched.
+
+        This attention cannot be merged with the text one into a single SDPA over the concatenated keys and values
+        (masked or not): IP-Adapter sums two independently normalized attentions, while a single softmax would
+        normalize the text and image tokens jointly.
+
+        Outside of autograd, the image keys and values are cached: they only depend on the CLIP image embedding and
+        the projection weights, so they are computed once instead of at every denoising step.
+    """
+
+    def __init__(
+        self,
+        text_cross_attention: fl.Attention,
+        scale: float = 1.0,
+        attention_backend: AttentionBackend = "sdpa",
+    ) -> None:
         self._scale = scale
+        self._key_value_cache: tuple[Tensor, int | None, tuple[Tensor, Tensor]] | None = None
         super().__init__(
             fl.Distribute(
                 fl.Identity(),
@@ -260,12 +378,65 @@ class ImageCrossAttention(fl.Chain):
                     ),
                 ),
             ),
-            ScaledDotProductAttention(
-                num_heads=text_cross_attention.num_heads, is_causal=text_cross_attention.is_causal
+            fl.Lambda(func=self.scale_value),
+            make_attention(
+                attention_backend, num_heads=text_cross_attention.num_heads, is_causal=text_cross_attention.is_causal
             ),
-            fl.Multiply(self.scale),
         )
 
+    def forward(self, *args: Tensor) -> Tensor:
+        if torch.is_grad_enabled():
+            return super().forward(*args)
+        attention = self.ensure_find(ScaledDotProductAttention)
+        key, value = self._cached_key_value()
+        return attention(args[0], key, value)
+
+    def _cached_key_value(self) -> tuple[Tensor, Tensor]:
+        """The image keys and (scaled) values, recomputed when the CLIP image embedding changes.
+
+        Note:
+            The cache is also cleared when the scale is set, when weights are loaded (`load_weights`,
+            `load_state_dict`) and when the module is moved or cast (e.g. `to`): editing the projection weights in
+            place otherwise requires calling `clear_cache`.
+        """
+        image_embedding = self.use_context("ip_adapter").get("clip_image_embedding")
+        assert image_embedding is not None, "context entry ip_adapter.clip_image_embedding is unset"
+        version = tensor_version(image_embedding)
+        # the embedding itself is held (and compared by identity) so that its memory cannot be reused by another one
+        if (
+            self._key_value_cache is None
+            or self._key_value_cache[0] is not image_embedding
+            or self._key_value_cache[1] != version
+        ):
+            key = self.layer(("Distribute", 1), fl.Chain)()
+            value = self.layer(("Distribute", 2), fl.Chain)()
+            if self.scale != 1.0:
+                value *= self.scale
+            self._key_value_cache = (image_embedding, version, (key, value))
+        return self._key_value_cache[2]
+
+    def clear_cache(self) -> None:
+        self._key_value_cache = None
+
+    def _apply(self, fn: Callable[[Tensor], Tensor], recurse: bool = True) -> "ImageCrossAttention":
+        self.clear_cache()
+        return super()._apply(fn, recurse)
+
+    def _load_from_state_dict(self, *args: Any, **kwargs: Any) -> None:
+        self.clear_cache()
+        super()._load_from_state_dict(*args, **kwargs)
+
+    def scale_value(self, query: Tensor, key: Tensor, value: Tensor) -> tuple[Tensor, Tensor, Tensor]:
+        return query, key, value if self.scale == 1.0 else value * self.scale
+
+    @property
+    def key_projection(self) -> fl.Linear:
+        return self.layer(("Distribute", 1, "Linear"), fl.Linear)
+
+    @property
+    def value_projection(self) -> fl.Linear:
+        return self.layer(("Distribute", 2, "Linear"), fl.Linear)
+
     @property
     def scale(self) -> float:
         return self._scale
@@ -273,7 +444,26 @@ class ImageCrossAttention(fl.Chain):
     @scale.setter
     def scale(self, value: float) -> None:
         self._scale = value
-        self.ensure_find(fl.Multiply).scale = value
+        self.clear_cache()
+
+    def load_weights(self, key_tensor: Tensor, value_tensor: Tensor) -> None:
+        self.key_projection.weight = nn.Parameter(key_tensor)
+        self.value_projection.weight = nn.Parameter(value_tensor)
+        self.clear_cache()
+
+
+class TextImageAttentionSum(fl.Sum):
+    """Sum of the text attention and the image cross-attention outputs.
+
+    Note:
+        While the image cross-attention scale is zero, the text attention output is returned as is: the image
+        branch is skipped altogether (its weights stay in the module tree).
+    """
+
+    def forward(self, *inputs: Any) -> Any:
+        if self.layer(1, ImageCrossAttention).scale == 0.0:
+            return self[0](*inputs)
+        return super().forward(*inputs)
 
 
 class CrossAttentionAdapter(fl.Chain, Adapter[fl.Attention]):
@@ -281,19 +471,35 @@ class CrossAttentionAdapter(fl.Chain, Adapter[fl.Attention]):
         self,
         target: fl.Attention,
         scale: float = 1.0,
+        attention_backend: AttentionBackend = "sdpa",
+        num_image_tokens: int = 4,
     ) -> None:
         self._scale = scale
+        self.num_image_tokens = num_image_tokens
+        self._warmed_up_on: tuple[Device, DType] | None = None  # see `_warmup_sdpa`
         with self.setup_adapter(target):
             clone = target.structural_copy()
             scaled_dot_product = clone.ensure_find(ScaledDotProductAttention)
             image_cross_attention = ImageCrossAttention(
                 text_cross_attention=clone,
                 scale=self.scale,
+                attention_backend=attention_backend,
+            )
+            text_attention = (
+                scaled_dot_product
+                if attention_backend == "sdpa"
+                else make_attention(
+                    attention_backend,
+                    num_heads=scaled_dot_product.num_heads,
+                    is_causal=scaled_dot_product.is_causal,
+                    is_optimized=scaled_dot_product.is_optimized,
+                    slice_size=scaled_dot_product.slice_size,
+                )
             )
             clone.replace(
                 old_module=scaled_dot_product,
-                new_module=fl.Sum(
-                    scaled_dot_product,
+                new_module=TextImageAttentionSum(
+                    text_attention,
                     image_cross_attention,
                 ),
             )
@@ -307,11 +513,11 @@ class CrossAttentionAdapter(fl.Chain, Adapter[fl.Attention]):
 
     @property
     def image_key_projection(self) -> fl.Linear:
-        return self.image_cross_attention.layer(("Distribute", 1, "Linear"), fl.Linear)
+        return self.image_cross_attention.key_projection
 
     @property
     def image_value_projection(self) -> fl.Linear:
-        return self.image_cross_attention.layer(("Distribute", 2, "Linear"), fl.Linear)
+        return self.image_cross_attention.value_projection
 
     @property
     def scale(self) -> float:
@@ -323,10 +529,40 @@ class CrossAttentionAdapter(fl.Chain, Adapter[fl.Attention]):
         self.image_cross_attention.scale = value
 
     def load_weights(self, key_tensor: Tensor, value_tensor: Tensor) -> None:
-        self.image_key_projection.weight = nn.Parameter(key_tensor)
-        self.image_value_projection.weight = nn.Parameter(value_tensor)
+        self.image_cross_attention.load_weights(key_tensor, value_tensor)
         self.image_cross_attention.to(self.device, self.dtype)
 
+    def inject(self: TCrossAttentionAdapter, parent: fl.Chain | None = None) -> TCrossAttentionAdapter:
+        super().inject(parent)
+        if (
+            self.device is not None
+            and self.device.type == "cuda"
+            and self._warmed_up_on != (warmup_on := (self.device, self.dtype))
+        ):
+            self._warmup_sdpa()
+            self._warmed_up_on = warmup_on
+        return self
+
+    @no_grad()
+    def _warmup_sdpa(self) -> None:
+        """Run the text and image attentions once on dummy inputs.
+
+        This moves the lazy CUDA initializations (kernel loading, cuBLAS handles, SageAttention's JIT...) out of the
+        first denoising step. Note that no attention mask is used: a boolean mask would rule out the fused kernels.
+
+        The dummy keys and values have the actual sequence lengths: 77 text tokens (CLIP's context length) and
+        `num_image_tokens` image tokens. It only runs on the first injection on a given device and dtype (not on every
+        inject / eject cycle).
+        """
+        text_image_attention = self.ensure_find(TextImageAttentionSum)
+        text_attention = text_image_attention.layer(0, ScaledDotProductAttention)
+        image_attention = self.image_cross_attention.ensure_find(ScaledDotProductAttention)
+        inner_dim = self.target.inner_dim
+        query = torch.zeros(1, 1, inner_dim, device=self.device, dtype=self.dtype)
+        for attention, sequence_length in ((text_attention, 77), (image_attention, self.num_image_tokens)):
+            key_value = torch.zeros(1, sequence_length, inner_dim, device=self.device, dtype=self.dtype)
+            attention(query, key_value, key_value)
+
 
 class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
     """Image Prompt adapter for a Stable Diffusion U-Net model.
@@ -339,6 +575,10 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
     _clip_image_encoder: list[CLIPImageEncoderH]
     _grid_image_encoder: list[CLIPImageEncoderH]
     _image_proj: list[fl.Module]
+    # CLIP normalization parameters, see `preprocess_image`
+    _clip_mean: Tensor
+    _clip_inv_std: Tensor
+    _zero_clip_embedding: Tensor
 
     def __init__(
         self,
@@ -348,6 +588,12 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
         scale: float = 1.0,
         fine_grained: bool = False,
         weights: dict[str, Tensor] | None = None,
+        autocast_dtype: DType | None = None,
+        use_cuda_graphs: bool = False,
+        resize_on_device: bool = False,
+        attention_backend: AttentionBackend = "sdpa",
+        enable_tf32: bool = False,
+        enable_fp16_accumulation: bool = False,
     ) -> None:
         """Initialize the adapter.
 
@@ -358,19 +604,55 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
             scale: The scale to use for the image prompt.
             fine_grained: Whether to use fine-grained image prompt.
             weights: The weights of the IPAdapter.
+            autocast_dtype: The dtype to compute the CLIP image embedding with `torch.autocast` (disabled if None).
+            use_cuda_graphs: Whether to capture the CLIP image embedding computation in a CUDA graph and replay it.
+            resize_on_device: Whether to resize image prompts on the GPU when the target is on a CUDA device, instead
+                of with PIL (see `preprocess_image`).
+            attention_backend: The attention implementation of the text and image cross-attentions, see `SageAttention`.
+            enable_tf32: Whether to allow TF32 matmuls while injected (process-global, restored on eject).
+            enable_fp16_accumulation: Whether to allow float16 accumulation in float16 matmuls on Hopper (or newer)
+                GPUs while injected (process-global, restored on eject). This lowers the precision of every float16
+                matmul in the process, including the U-Net's.
         """
         with self.setup_adapter(target):
             super().__init__(target)
 
         self.fine_grained = fine_grained
+        self.autocast_dtype = autocast_dtype
+        self.use_cuda_graphs = use_cuda_graphs
+        self.resize_on_device = resize_on_device
         self._clip_image_encoder = [clip_image_encoder]
         if fine_grained:
             self._grid_image_encoder = [self.convert_to_grid_features(clip_image_encoder)]
         self._image_proj = [image_proj]
+        self._negative_embedding_cache: tuple[tuple[Any, ...], Tensor] | None = None
+        self._cuda_graph: (
+            tuple[tuple[Any, ...], torch.cuda.CUDAGraph, Tensor, tuple[Tensor | None, Tensor]] | None
+        ) = None
+        self.enable_tf32 = enable_tf32
+        self.enable_fp16_accumulation = enable_fp16_accumulation
+        self._matmul_flags: tuple[bool, bool, bool | None] | None = None  # the global flags to restore on eject
+        clip_mean = tensor([0.48145466, 0.4578275, 0.40821073]).view(-1, 1, 1)
+        clip_std = tensor([0.26862954, 0.26130258, 0.27577711]).view(-1, 1, 1)
+        self.register_buffer("_clip_mean", clip_mean.to(target.device, target.dtype), persistent=False)
+        self.register_buffer("_clip_inv_std", (1 / clip_std).to(target.device, target.dtype), persistent=False)
+        self.register_buffer(
+            "_zero_clip_embedding",
+            torch.zeros(1, clip_image_encoder.output_dim, device=target.device, dtype=target.dtype),
+            persistent=False,
+        )
 
+        # only used to warm up the image attentions with the right shapes (see `CrossAttentionAdapter._warmup_sdpa`)
+        num_image_tokens = image_proj.num_tokens if isinstance(image_proj, ImageProjection | PerceiverResampler) else 4
         self.sub_adapters = [
-            CrossAttentionAdapter(target=cross_attn, scale=scale)
-            for cross_attn in filter(lambda attn: type(attn) != fl.SelfAttention, target.layers(fl.Attention))
+            CrossAttentionAdapter(
+                target=cross_attn,
+                scale=scale,
+                attention_backend=attention_backend,
+                num_image_tokens=num_image_tokens,
+            )
+            for cross_attn in target.layers(fl.Attention)
+            if not isinstance(cross_attn, fl.SelfAttention)
         ]
 
         if weights is not None:
@@ -407,13 +689,55 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
     def inject(self: "TIPAdapter", parent: fl.Chain | None = None) -> "TIPAdapter":
         for adapter in self.sub_adapters:
             adapter.inject()
-        return super().inject(parent)
+        injected = super().inject(parent)
+        # Only once injected, so that a failed injection does not leave the global flags changed
+        if self.enable_tf32 or self.enable_fp16_accumulation:
+            self._enable_reduced_precision_matmul()
+        return injected
 
     def eject(self) -> None:
         for adapter in self.sub_adapters:
             adapter.eject()
+        self._restore_matmul_precision()
         super().eject()
 
+    def _enable_reduced_precision_matmul(self) -> None:
+        """Allow TF32 matmuls and convolutions, and/or float16 accumulation on Hopper (or newer) GPUs, as configured.
+
+        Note:
+            These are process-global PyTorch settings: the previous values are restored on eject.
+        """
+        if self._matmul_flags is not None:
+            return
+        matmul = torch.backends.cuda.matmul
+        has_fp16_accumulation = hasattr(matmul, "allow_fp16_accumulation")
+        self._matmul_flags = (
+            matmul.allow_tf32,
+            torch.backends.cudnn.allow_tf32,
+            matmul.allow_fp16_accumulation if has_fp16_accumulation else None,
+        )
+        if self.enable_tf32:
+            matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+        device = self.target.device
+        if (
+            self.enable_fp16_accumulation
+            and has_fp16_accumulation
+            and device is not None
+            and device.type == "cuda"
+            and torch.cuda.get_device_capability(device) >= (9, 0)
+        ):
+            matmul.allow_fp16_accumulation = True
+
+    def _restore_matmul_precision(self) -> None:
+        if self._matmul_flags is None:
+            return
+        matmul = torch.backends.cuda.matmul
+        matmul.allow_tf32, torch.backends.cudnn.allow_tf32, allow_fp16_accumulation = self._matmul_flags
+        if allow_fp16_accumulation is not None:
+            matmul.allow_fp16_accumulation = allow_fp16_accumulation
+        self._matmul_flags = None
+
     @property
     def scale(self) -> float:
         """The scale of the adapter."""
@@ -440,16 +764,22 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
         self.set_context("ip_adapter", {"clip_image_embedding": image_embedding})
 
     @overload
-    def compute_clip_image_embedding(self, image_prompt: Tensor) -> Tensor:
+    def compute_clip_image_embedding(self, image_prompt: Tensor, *, classifier_free_guidance: bool = True) -> Tensor:
         ...
 
     @overload
-    def compute_clip_image_embedding(self, image_prompt: Image.Image) -> Tensor:
+    def compute_clip_image_embedding(
+        self, image_prompt: Image.Image, *, classifier_free_guidance: bool = True
+    ) -> Tensor:
         ...
 
     @overload
     def compute_clip_image_embedding(
-        self, image_prompt: list[Image.Image], weights: list[float] | None = None
+        self,
+        image_prompt: list[Image.Image],
+        weights: list[float] | None = None,
+        *,
+        classifier_free_guidance: bool = True,
     ) -> Tensor:
         ...
 
@@ -458,6 +788,8 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
         image_prompt: Tensor | Image.Image | list[Image.Image],
         weights: list[float] | None = None,
         concat_batches: bool = True,
+        *,
+        classifier_free_guidance: bool = True,
     ) -> Tensor:
         """Compute the CLIP image embedding.
 
@@ -465,6 +797,9 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
             image_prompt: The image prompt to use.
             weights: The scale to use for the image prompt.
             concat_batches: Whether to concatenate the batches.
+            classifier_free_guidance: Whether to prepend the negative (unconditional) embedding. Set to `False` when
+                sampling without classifier-free guidance (e.g. with distilled few-step models) so that the UNet batch
+                is not doubled.
 
         Returns:
             The CLIP image embedding.
@@ -475,13 +810,36 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
             assert all(isinstance(image, Image.Image) for image in image_prompt)
             image_prompt = cat([self.preprocess_image(image) for image in image_prompt])
 
-        negative_embedding, conditional_embedding = self._compute_clip_image_embedding(image_prompt)
+        autocast_dtype = self._resolve_autocast_dtype(image_prompt.device)
+        # Note: autocast is not entered at all when disabled since some devices (e.g. MPS) do not support it
+        autocast = (
+            torch.autocast(
+                device_type=image_prompt.device.type,
+                dtype=autocast_dtype,
+                cache_enabled=not self.use_cuda_graphs,  # required for CUDA graph capture
+            )
+            if autocast_dtype is not None
+            else nullcontext()
+        )
+        with autocast:
+            if self.use_cuda_graphs and image_prompt.is_cuda and not torch.is_grad_enabled():
+                negative_embedding, conditional_embedding = self._replay_clip_image_embedding(
+                    image_prompt, classifier_free_guidance=classifier_free_guidance
+                )
+            else:
+                negative_embedding, conditional_embedding = self._compute_clip_image_embedding(
+                    image_prompt, classifier_free_guidance=classifier_free_guidance
+                )
+        if negative_embedding is not None:
+            negative_embedding = negative_embedding.to(dtype=self.target.dtype)
+        conditional_embedding = conditional_embedding.to(dtype=self.target.dtype)
 
         batch_size = image_prompt.shape[0]
         if weights is not None:
             assert len(weights) == batch_size, f"Got {len(weights)} weights for {batch_size} images"
             if any(weight != 1.0 for weight in weights):
-                conditional_embedding *= (
+                # Note: not in place, the embedding may be a view (see `_compute_clip_image_embedding`)
+                conditional_embedding = conditional_embedding * (
                     tensor(weights, device=conditional_embedding.device, dtype=conditional_embedding.dtype)
                     .unsqueeze(-1)
                     .unsqueeze(-1)
@@ -490,23 +848,128 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
         if batch_size > 1 and concat_batches:
             # Create a longer image tokens sequence when a batch of images is given
             # See https://github.com/tencent-ailab/IP-Adapter/issues/99
-            negative_embedding = cat(negative_embedding.chunk(batch_size), dim=1)
-            conditional_embedding = cat(conditional_embedding.chunk(batch_size), dim=1)
+            # Note: this is `cat(embedding.chunk(batch_size), dim=1)`, written as a reshape to avoid the copies
+            if negative_embedding is not None:
+                negative_embedding = negative_embedding.reshape(1, -1, negative_embedding.shape[-1])
+            conditional_embedding = conditional_embedding.reshape(1, -1, conditional_embedding.shape[-1])
+
+        if negative_embedding is None:
+            return conditional_embedding
 
         return cat((negative_embedding, conditional_embedding))
 
-    def _compute_clip_image_embedding(self, image_prompt: Tensor) -> tuple[Tensor, Tensor]:
+    def _resolve_autocast_dtype(self, device: Device) -> DType | None:
+        """The dtype to autocast the CLIP image embedding computation to (None if autocast is disabled).
+
+        Note:
+            Autocast keeps precision-sensitive ops (e.g. the LayerNorm of the image projection) in float32.
+            On CUDA devices without bfloat16 support, float16 is used instead.
+        """
+        if self.autocast_dtype is None:
+            return None
+        if self.autocast_dtype == torch.bfloat16 and device.type == "cuda" and not torch.cuda.is_bf16_supported():
+            return torch.float16
+        return self.autocast_dtype
+
+    def _cuda_graph_key(self, image_prompt: Tensor, classifier_free_guidance: bool = True) -> tuple[Any, ...]:
+        """The key of the captured CLIP image embedding CUDA graph (see `use_cuda_graphs`).
+
+        It changes whenever the image prompt shape, dtype or device changes, or the weights of the image encoder or
+        the image projection are replaced or updated.
+        """
         image_encoder = self.clip_image_encoder if not self.fine_grained else self.grid_image_encoder
-        clip_embedding = image_encoder(image_prompt)
-        conditional_embedding = self.image_proj(clip_embedding)
+        return (
+            image_prompt.shape,
+            image_prompt.dtype,
+            image_prompt.device,
+            classifier_free_guidance,
+            self._resolve_autocast_dtype(image_prompt.device),
+            *((param.data_ptr(), tensor_version(param)) for param in image_encoder.parameters()),
+            *((param.data_ptr(), tensor_version(param)) for param in self.image_proj.parameters()),
+        )
+
+    def _replay_clip_image_embedding(
+        self, image_prompt: Tensor, classifier_free_guidance: bool = True
+    ) -> tuple[Tensor | None, Tensor]:
+        """Compute the CLIP image embedding by replaying a captured CUDA graph.
+
+        The graph is (re)captured whenever its key changes (see `_cuda_graph_key`).
+
+        See https://pytorch.org/docs/stable/notes/cuda.html#cuda-graphs for more details.
+        """
+        graph_key = self._cuda_graph_key(image_prompt, classifier_free_guidance=classifier_free_guidance)
+        if self._cuda_graph is None or self._cuda_graph[0] != graph_key:
+            self._cuda_graph = None  # release the previous graph before capturing a new one
+            static_input = image_prompt.clone()
+            # Warm up on a side stream so that lazy initializations are not captured
+            # Note: the constructor is typed as returning the base class
+            stream = cast(torch.cuda.Stream, torch.cuda.Stream(device=image_prompt.device))
+            stream.wait_stream(torch.cuda.current_stream(image_prompt.device))
+            with torch.cuda.stream(stream):
+                for _ in range(3):
+                    self._compute_clip_image_embedding(static_input, classifier_free_guidance=classifier_free_guidance)
+            torch.cuda.current_stream(image_prompt.device).wait_stream(stream)
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                static_outputs = self._compute_clip_image_embedding(
+                    static_input, classifier_free_guidance=classifier_free_guidance
+                )
+            self._cuda_graph = (graph_key, graph, static_input, static_outputs)
+
+        _, graph, static_input, (negative_embedding, conditional_embedding) = self._cuda_graph
+        static_input.copy_(image_prompt)
+        graph.replay()
+        # The static outputs are overwritten by the next replay
+        if negative_embedding is not None:
+            negative_embedding = negative_embedding.clone()
+        return negative_embedding, conditional_embedding.clone()
+
+    def _compute_clip_image_embedding(
+        self, image_prompt: Tensor, classifier_free_guidance: bool = True
+    ) -> tuple[Tensor | None, Tensor]:
+        if not classifier_free_guidance:
+            image_encoder = self.clip_image_encoder if not self.fine_grained else self.grid_image_encoder
+            return None, self.image_proj(image_encoder(image_prompt))
         if not self.fine_grained:
-            negative_embedding = self.image_proj(zeros_like(clip_embedding))
+            clip_embedding = self.clip_image_encoder(image_prompt)
+            conditional_embedding = self.image_proj(clip_embedding)
+            negative_embedding = self._compute_negative_embedding(clip_embedding)
         else:
             # See https://github.com/tencent-ailab/IP-Adapter/blob/d580c50/tutorial_train_plus.py#L351-L352
-            clip_embedding = image_encoder(zeros_like(image_prompt))
-            negative_embedding = self.image_proj(clip_embedding)
+            # The zero (negative) and actual image prompts go through the encoder and the projection as one batch
+            clip_embedding = self.grid_image_encoder(cat((zeros_like(image_prompt), image_prompt)))
+            negative_embedding, conditional_embedding = self.image_proj(clip_embedding).chunk(2)
         return negative_embedding, conditional_embedding
 
+    def _compute_negative_embedding(self, clip_embedding: Tensor) -> Tensor:
+        """Project a zero CLIP image embedding, i.e. the unconditional image prompt.
+
+        The projection only depends on the `image_proj` weights, so it is cached (outside of autograd) and
+        recomputed whenever the device, the dtype or the weights change.
+        """
+        batch_size = clip_embedding.shape[0]
+        if torch.is_grad_enabled():
+            return self.image_proj(self._zero_clip_embedding_like(clip_embedding))
+
+        cache_key = (
+            clip_embedding.device,
+            clip_embedding.dtype,
+            *((param.data_ptr(), tensor_version(param)) for param in self.image_proj.parameters()),
+        )
+        if self._negative_embedding_cache is None or self._negative_embedding_cache[0] != cache_key:
+            negative_embedding = self.image_proj(self._zero_clip_embedding_like(clip_embedding[:1]))
+            self._negative_embedding_cache = (cache_key, negative_embedding)
+
+        _, negative_embedding = self._negative_embedding_cache
+        return negative_embedding.expand(batch_size, *negative_embedding.shape[1:])
+
+    def _zero_clip_embedding_like(self, clip_embedding: Tensor) -> Tensor:
+        """A zero CLIP image embedding shaped like `clip_embedding`, broadcast from a persistent buffer."""
+        zero = self._zero_clip_embedding
+        if zero.device != clip_embedding.device or zero.dtype != clip_embedding.dtype:
+            self._zero_clip_embedding = zero = zero.to(device=clip_embedding.device, dtype=clip_embedding.dtype)
+        return zero.expand_as(clip_embedding)
+
     def preprocess_image(
         self,
         image: Image.Image,
@@ -520,18 +983,50 @@ class IPAdapter(Generic[T], fl.Chain, Adapter[T]):
             The default mean and std are parameters from
             https://github.com/openai/CLIP
 
+            The returned tensor uses the `torch.channels_last` memory format, which is the layout preferred by
+            cuDNN for the patch embedding convolution of the CLIP image encoder.
+
+            The image is resized with PIL, unless `resize_on_device` is set and the target is on a CUDA device: it is
+            then resized on the GPU (antialiased bicubic), which is faster for large images but does not exactly match
+            PIL (notably on high-frequency content).
+
         Args:
             image: The image to preprocess.
-            size: The size to resize the image to.
+            size: The size (width, height) to resize the image to.
             mean: The mean to use for normalization.
             std: The standard deviation to use for normalization.
         """
+        # Upload the raw uint8 pixels, then convert (and, if enabled, resize) on the target device
+        device = self.target.device
+        if image.size != size and not (self.resize_on_device and device is not None and device.type == "cuda"):
+            image = image.resize(size)
+        rgb_image = image if image.mode == "RGB" else image.convert("RGB")
+        pixels = torch.from_numpy(np.array(rgb_image)).to(device=self.target.device)  # np.asarray is read-only
+        image_tensor = pixels.permute(2, 0, 1).unsqueeze(0).float().div_(255.0)
+        if image.size != size:
+            width, height = size
+            image_tensor = interpolate(image_tensor, torch.Size((height, width)), mode="bicubic", antialias=True)
+            image_tensor = image_tensor.clamp_(0, 1)
+        image_tensor = image_tensor.to(dtype=self.target.dtype, memory_format=torch.channels_last)
+        if mean is None and std is None:
+            return self._normalize(image_tensor)
         return normalize(
-            image_to_tensor(image.resize(size), device=self.target.device, dtype=self.target.dtype),
+            image_tensor,
             mean=[0.48145466, 0.4578275, 0.40821073] if mean is None else mean,
             std=[0.26862954, 0.26130258, 0.27577711] if std is None else std,
         )
 
+    def _normalize(self, x: Tensor) -> Tensor:
+        """Normalize `x` in place with the default CLIP mean and std, kept as buffers to avoid host-to-device copies.
+
+        Args:
+            x: The image tensor to normalize (owned by the caller, see `preprocess_image`).
+        """
+        if self._clip_mean.device != x.device or self._clip_mean.dtype != x.dtype:
+            self._clip_mean = self._clip_mean.to(device=x.device, dtype=x.dtype)
+            self._clip_inv_std = self._clip_inv_std.to(device=x.device, dtype=x.dtype)
+        return x.sub_(self._clip_mean).mul_(self._clip_inv_std)
+
     @staticmethod
     def convert_to_grid_features(clip_image_encoder: CLIPImageEncoderH) -> CLIPImageEncoderH:
         encoder_clone = clip_image_encoder.structural_copy()
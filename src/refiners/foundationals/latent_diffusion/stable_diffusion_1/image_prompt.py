@@ -1,12 +1,24 @@
-from torch import Tensor
+from torch import Tensor, dtype as DType
 
 from refiners.foundationals.clip.image_encoder import CLIPImageEncoderH
 from refiners.foundationals.latent_diffusion.cross_attention import CrossAttentionBlock2d
-from refiners.foundationals.latent_diffusion.image_prompt import ImageProjection, IPAdapter, PerceiverResampler
+from refiners.foundationals.latent_diffusion.image_prompt import (
+    AttentionBackend,
+    ImageProjection,
+    IPAdapter,
+    PerceiverResampler,
+)
 from refiners.foundationals.latent_diffusion.stable_diffusion_1.unet import SD1UNet
 
 
 class SD1IPAdapter(IPAdapter[SD1UNet]):
+    """Image Prompt adapter for the Stable Diffusion 1.5 U-Net model.
+
+    Note:
+        The `"sage2"` attention backend has no effect here: the head dimensions of the SD1 U-Net (40, 80 and 160) are
+        not supported by SageAttention, which falls back to PyTorch's SDPA (see `sage_dot_product_attention`).
+    """
+
     def __init__(
         self,
         target: SD1UNet,
@@ -15,6 +27,12 @@ class SD1IPAdapter(IPAdapter[SD1UNet]):
         scale: float = 1.0,
         fine_grained: bool = False,
         weights: dict[str, Tensor] | None = None,
+        autocast_dtype: DType | None = None,
+        use_cuda_graphs: bool = False,
+        resize_on_device: bool = False,
+        attention_backend: AttentionBackend = "sdpa",
+        enable_tf32: bool = False,
+        enable_fp16_accumulation: bool = False,
     ) -> None:
         clip_image_encoder = clip_image_encoder or CLIPImageEncoderH(device=target.device, dtype=target.dtype)
 
@@ -50,4 +68,10 @@ class SD1IPAdapter(IPAdapter[SD1UNet]):
             scale=scale,
             fine_grained=fine_grained,
             weights=weights,
+            autocast_dtype=autocast_dtype,
+            use_cuda_graphs=use_cuda_graphs,
+            resize_on_device=resize_on_device,
+            attention_backend=attention_backend,
+            enable_tf32=enable_tf32,
+            enable_fp16_accumulation=enable_fp16_accumulation,
         )
@@ -1,8 +1,13 @@
-from torch import Tensor
+from torch import Tensor, dtype as DType
 
 from refiners.foundationals.clip.image_encoder import CLIPImageEncoderH
 from refiners.foundationals.latent_diffusion.cross_attention import CrossAttentionBlock2d
-from refiners.foundationals.latent_diffusion.image_prompt import ImageProjection, IPAdapter, PerceiverResampler
+from refiners.foundationals.latent_diffusion.image_prompt import (
+    AttentionBackend,
+    ImageProjection,
+    IPAdapter,
+    PerceiverResampler,
+)
 from refiners.foundationals.latent_diffusion.stable_diffusion_xl.unet import SDXLUNet
 
 
@@ -17,6 +22,12 @@ class SDXLIPAdapter(IPAdapter[SDXLUNet]):
         scale: float = 1.0,
         fine_grained: bool = False,
         weights: dict[str, Tensor] | None = None,
+        autocast_dtype: DType | None = None,
+        use_cuda_graphs: bool = False,
+        resize_on_device: bool = False,
+        attention_backend: AttentionBackend = "sdpa",
+        enable_tf32: bool = False,
+        enable_fp16_accumulation: bool = False,
     ) -> None:
         """Initialize the adapter.
 
@@ -27,6 +38,14 @@ class SDXLIPAdapter(IPAdapter[SDXLUNet]):
             scale: The scale to use for the image prompt.
             fine_grained: Whether to use fine-grained image prompt.
             weights: The weights of the IPAdapter.
+            autocast_dtype: The dtype to compute the CLIP image embedding with `torch.autocast` (disabled if None).
+            use_cuda_graphs: Whether to capture the CLIP image embedding computation in a CUDA graph and replay it.
+            resize_on_device: Whether to resize image prompts on the GPU when the target is on a CUDA device, instead
+                of with PIL (see `IPAdapter.preprocess_image`).
+            attention_backend: The attention implementation of the text and image cross-attentions, see `SageAttention`.
+            enable_tf32: Whether to allow TF32 matmuls while injected (process-global, restored on eject).
+            enable_fp16_accumulation: Whether to allow float16 accumulation in float16 matmuls on Hopper (or newer)
+                GPUs while injected (process-global, restored on eject).
         """
         clip_image_encoder = clip_image_encoder or CLIPImageEncoderH(device=target.device, dtype=target.dtype)
 
@@ -62,4 +81,10 @@ class SDXLIPAdapter(IPAdapter[SDXLUNet]):
             scale=scale,
             fine_grained=fine_grained,
             weights=weights,
+            autocast_dtype=autocast_dtype,
+            use_cuda_graphs=use_cuda_graphs,
+            resize_on_device=resize_on_device,
+            attention_backend=attention_backend,
+            enable_tf32=enable_tf32,
+            enable_fp16_accumulation=enable_fp16_accumulation,
         )
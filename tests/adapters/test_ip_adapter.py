@@ -1,12 +1,22 @@
+from dataclasses import dataclass
 from typing import overload
 
+import numpy as np
 import pytest
 import torch
+from PIL import Image
 
 import refiners.fluxion.layers as fl
-from refiners.fluxion.utils import no_grad
+from refiners.fluxion.utils import image_to_tensor, no_grad, normalize
+from refiners.foundationals.clip.image_encoder import CLIPImageEncoder, CLIPImageEncoderH
 from refiners.foundationals.latent_diffusion import SD1IPAdapter, SD1UNet, SDXLIPAdapter, SDXLUNet
-from refiners.foundationals.latent_diffusion.image_prompt import ImageCrossAttention
+from refiners.foundationals.latent_diffusion.image_prompt import (
+    AttentionBackend,
+    CrossAttentionAdapter,
+    ImageCrossAttention,
+    SageAttention,
+    TextImageAttentionSum,
+)
 
 
 @overload
@@ -26,6 +36,34 @@ def new_adapter(target: SD1UNet | SDXLUNet) -> SD1IPAdapter | SDXLIPAdapter:
         return SDXLIPAdapter(target=target)
 
 
+class TinyCLIPImageEncoder(CLIPImageEncoderH):
+    """A tiny CLIP image encoder, with as many layers as `CLIPImageEncoderH` (see `convert_to_grid_features`)."""
+
+    def __init__(self, device: torch.device | str | None = None, dtype: torch.dtype | None = None) -> None:
+        CLIPImageEncoder.__init__(
+            self,
+            embedding_dim=64,
+            output_dim=64,
+            patch_size=32,
+            num_layers=32,
+            num_attention_heads=4,
+            feedforward_dim=128,
+            device=device,
+            dtype=dtype,
+        )
+
+
+@pytest.fixture(scope="module")
+def sd1_unet(test_device: torch.device) -> SD1UNet:
+    return SD1UNet(in_channels=4, device=test_device, dtype=torch.float16)
+
+
+def new_tiny_adapter(target: SD1UNet, fine_grained: bool = False) -> SD1IPAdapter:
+    """An IP-Adapter with a tiny CLIP image encoder (the U-Net is left untouched until injected)."""
+    clip_image_encoder = TinyCLIPImageEncoder(device=target.device, dtype=target.dtype)
+    return SD1IPAdapter(target=target, clip_image_encoder=clip_image_encoder, fine_grained=fine_grained)
+
+
 @no_grad()
 @pytest.mark.parametrize("k_unet", [SD1UNet, SDXLUNet])
 def test_inject_eject(k_unet: type[SD1UNet] | type[SDXLUNet], test_device: torch.device):
@@ -45,15 +83,261 @@ def test_scale(k_unet: type[SD1UNet] | type[SDXLUNet], test_device: torch.device
     unet = k_unet(in_channels=4, device=test_device, dtype=torch.float16)
     adapter = new_adapter(unet).inject()
 
-    def predicate(m: fl.Module, p: fl.Chain) -> bool:
-        return isinstance(p, ImageCrossAttention) and isinstance(m, fl.Multiply)
-
-    for m, _ in unet.walk(predicate):
-        assert isinstance(m, fl.Multiply)
+    image_cross_attentions = [m for m, _ in unet.walk(ImageCrossAttention)]
+    assert len(image_cross_attentions) == len(adapter.sub_adapters)
+    weights = [m.value_projection.weight.clone() for m in image_cross_attentions]
+    for m in image_cross_attentions:
         assert m.scale == 1.0
 
     adapter.scale = 0.42
     assert adapter.scale == 0.42
-    for m, _ in unet.walk(predicate):
-        assert isinstance(m, fl.Multiply)
+    for m, weight in zip(image_cross_attentions, weights):
         assert m.scale == 0.42
+        # the scale is not folded into the projection weights
+        assert torch.equal(m.value_projection.weight, weight)
+
+
+@dataclass
+class CrossAttentionSetup:
+    """A standalone cross-attention (in a chain, to be adapted), with its inputs."""
+
+    attention: fl.Attention
+    target: fl.Chain
+    x: torch.Tensor
+    text_embedding: torch.Tensor
+
+    def forward(self) -> torch.Tensor:
+        return self.target(self.x, self.text_embedding, self.text_embedding)
+
+    def set_clip_image_embedding(self, image_embedding: torch.Tensor | None = None) -> None:
+        if image_embedding is None:
+            image_embedding = torch.randn(1, 4, 768, device=self.x.device)
+        self.target.set_context("ip_adapter", {"clip_image_embedding": image_embedding})
+
+    def check_against_uncached(self) -> None:
+        with no_grad():
+            cached = self.forward()
+        uncached = self.forward().detach()  # autograd bypasses the image keys and values cache
+        assert torch.allclose(cached, uncached, atol=1e-6)
+
+
+@pytest.fixture
+def cross_attention(test_device: torch.device) -> CrossAttentionSetup:
+    attention = fl.Attention(
+        embedding_dim=64, num_heads=4, key_embedding_dim=768, value_embedding_dim=768, device=test_device
+    )
+    return CrossAttentionSetup(
+        attention=attention,
+        target=fl.Chain(attention),
+        x=torch.randn(1, 16, 64, device=test_device),
+        text_embedding=torch.randn(1, 77, 768, device=test_device),
+    )
+
+
+def test_image_key_value_cache(cross_attention: CrossAttentionSetup, test_device: torch.device):
+    adapter = CrossAttentionAdapter(cross_attention.attention).inject(cross_attention.target)
+
+    cross_attention.set_clip_image_embedding()
+    cross_attention.check_against_uncached()
+    cross_attention.set_clip_image_embedding()
+    cross_attention.check_against_uncached()
+    adapter.scale = 0.5
+    cross_attention.check_against_uncached()
+    adapter.load_weights(torch.randn(64, 768, device=test_device), torch.randn(64, 768, device=test_device))
+    cross_attention.check_against_uncached()
+    image_cross_attention = adapter.image_cross_attention
+    state_dict = image_cross_attention.state_dict()
+    image_cross_attention.load_state_dict({key: torch.randn_like(value) for key, value in state_dict.items()})
+    cross_attention.check_against_uncached()
+
+    # inference tensors do not track their version
+    with torch.inference_mode():
+        image_embedding = torch.randn(1, 4, 768, device=test_device)
+        cross_attention.set_clip_image_embedding(image_embedding)
+        cached = cross_attention.forward()
+        assert torch.equal(cross_attention.forward(), cached)
+    cross_attention.set_clip_image_embedding(image_embedding.clone())
+    uncached = cross_attention.forward().detach()
+    assert torch.allclose(cached, uncached, atol=1e-6)
+
+
+def test_negative_embedding_cache(sd1_unet: SD1UNet):
+    adapter = new_tiny_adapter(sd1_unet)
+    image_prompt = torch.randn(1, 3, 224, 224, device=sd1_unet.device, dtype=sd1_unet.dtype)
+    zero_clip_embedding = torch.zeros(1, 64, device=sd1_unet.device, dtype=sd1_unet.dtype)
+
+    def check_negative_embedding() -> None:
+        with no_grad():
+            negative_embedding = adapter.compute_clip_image_embedding(image_prompt)[:1]
+            assert torch.allclose(negative_embedding, adapter.image_proj(zero_clip_embedding))
+
+    check_negative_embedding()
+    check_negative_embedding()
+    with no_grad():
+        for param in adapter.image_proj.parameters():
+            param.mul_(0.5)
+    check_negative_embedding()
+    adapter.image_proj.load_state_dict({k: torch.randn_like(v) for k, v in adapter.image_proj.state_dict().items()})
+    check_negative_embedding()
+
+    # autograd bypasses the cache: the negative embedding back-propagates to the projection
+    adapter.compute_clip_image_embedding(image_prompt)[:1].float().sum().backward()
+    assert any(param.grad is not None and param.grad.any() for param in adapter.image_proj.parameters())
+
+
+def test_negative_embedding_cache_inference_mode(sd1_unet: SD1UNet):
+    # inference tensors (here, the projection weights) do not track their version
+    with torch.inference_mode():
+        adapter = new_tiny_adapter(sd1_unet)
+        image_prompt = torch.randn(1, 3, 224, 224, device=sd1_unet.device, dtype=sd1_unet.dtype)
+        first = adapter.compute_clip_image_embedding(image_prompt)
+        assert torch.equal(adapter.compute_clip_image_embedding(image_prompt), first)
+
+
+@no_grad()
+def test_zero_scale(cross_attention: CrossAttentionSetup):
+    target = cross_attention.target
+    expected = cross_attention.forward()
+
+    adapter = CrossAttentionAdapter(cross_attention.attention, scale=0.0).inject(target)
+    cross_attention.set_clip_image_embedding()
+    state_dict_keys = set(target.state_dict().keys())
+    # the image branch is skipped altogether
+    assert torch.equal(cross_attention.forward(), expected)
+
+    adapter.scale = 1.0
+    assert not torch.allclose(cross_attention.forward(), expected)
+
+    adapter.scale = 0.0
+    assert torch.equal(cross_attention.forward(), expected)
+    # the module tree does not depend on the scale
+    assert len(list(target.walk(ImageCrossAttention))) == 1
+    assert set(target.state_dict().keys()) == state_dict_keys
+
+
+@no_grad()
+def test_sage_attention_backend(cross_attention: CrossAttentionSetup, test_device: torch.device):
+    cross_attention.set_clip_image_embedding()
+    key_tensor, value_tensor = torch.randn(64, 768, device=test_device), torch.randn(64, 768, device=test_device)
+
+    backends: list[AttentionBackend] = ["sdpa", "sage2"]
+    outputs: list[torch.Tensor] = []
+    for backend in backends:
+        adapter = CrossAttentionAdapter(cross_attention.attention, scale=0.5, attention_backend=backend)
+        adapter.load_weights(key_tensor, value_tensor)
+        adapter.inject(cross_attention.target)
+        outputs.append(cross_attention.forward())
+        adapter.eject()
+
+    # float32 inputs (and, on CPU, the device): SageAttention falls back to PyTorch's SDPA
+    sdpa_output, sage_output = outputs
+    assert torch.allclose(sage_output, sdpa_output, atol=1e-6)
+
+
+def test_sage_attention_is_optimized():
+    attention = fl.Attention(
+        embedding_dim=64, num_heads=4, key_embedding_dim=768, value_embedding_dim=768, is_optimized=False
+    )
+    adapter = CrossAttentionAdapter(attention, attention_backend="sage2")
+    text_attention = adapter.ensure_find(TextImageAttentionSum)[0]
+    assert isinstance(text_attention, SageAttention) and not text_attention.is_optimized
+
+
+def test_warmup_once(cross_attention: CrossAttentionSetup, test_device: torch.device, monkeypatch: pytest.MonkeyPatch):
+    if test_device.type != "cuda":
+        pytest.skip("the attentions are only warmed up on CUDA devices")
+    adapter = CrossAttentionAdapter(cross_attention.attention)
+    warmups: list[CrossAttentionAdapter] = []
+    monkeypatch.setattr(CrossAttentionAdapter, "_warmup_sdpa", lambda self: warmups.append(self))  # type: ignore
+    for _ in range(2):
+        adapter.inject(cross_attention.target)
+        adapter.eject()
+    assert warmups == [adapter]
+
+
+@no_grad()
+def test_cuda_graph_replay(test_device: torch.device):
+    if test_device.type != "cuda":
+        pytest.skip("CUDA graphs require a CUDA device")
+    unet = SD1UNet(in_channels=4, device=test_device, dtype=torch.float16)
+    adapter = SD1IPAdapter(target=unet, use_cuda_graphs=True).inject()
+    image_prompt = torch.randn(1, 3, 224, 224, device=test_device, dtype=torch.float16)
+
+    def check_against_eager(image_prompt: torch.Tensor, classifier_free_guidance: bool = True) -> None:
+        replayed = adapter.compute_clip_image_embedding(image_prompt, classifier_free_guidance=classifier_free_guidance)
+        adapter.use_cuda_graphs = False
+        eager = adapter.compute_clip_image_embedding(image_prompt, classifier_free_guidance=classifier_free_guidance)
+        adapter.use_cuda_graphs = True
+        assert replayed.shape == eager.shape
+        assert torch.allclose(replayed, eager, atol=1e-3)
+
+    check_against_eager(image_prompt)
+    check_against_eager(torch.randn_like(image_prompt))
+    # a new batch size or classifier-free guidance setting triggers a new capture
+    check_against_eager(torch.cat((image_prompt, image_prompt)))
+    check_against_eager(image_prompt, classifier_free_guidance=False)
+    # and so do in-place weight updates and loaded weights
+    for param in adapter.image_proj.parameters():
+        param.mul_(0.5)
+    check_against_eager(image_prompt)
+    adapter.image_proj.load_state_dict({k: torch.randn_like(v) for k, v in adapter.image_proj.state_dict().items()})
+    check_against_eager(image_prompt)
+    next(adapter.clip_image_encoder.parameters()).mul_(0.5)
+    check_against_eager(image_prompt)
+
+
+@no_grad()
+def test_preprocess_image(sd1_unet: SD1UNet):
+    adapter = new_tiny_adapter(sd1_unet)
+    generator = torch.Generator().manual_seed(0)
+    pixels = torch.rand(384, 512, 3, generator=generator)
+    image = Image.fromarray((pixels.numpy() * 255).round().astype(np.uint8))
+    expected = normalize(
+        image_to_tensor(image.resize((224, 224)), device=sd1_unet.device, dtype=sd1_unet.dtype),
+        mean=[0.48145466, 0.4578275, 0.40821073],
+        std=[0.26862954, 0.26130258, 0.27577711],
+    )
+
+    # resized with PIL by default, like the reference
+    image_prompt = adapter.preprocess_image(image)
+    assert image_prompt.shape == expected.shape == (1, 3, 224, 224)
+    assert (image_prompt - expected).abs().max() < 1e-2  # float16 rounding only
+
+    if sd1_unet.device.type != "cuda":
+        return
+    # opt-in: resized on the GPU, which differs from PIL on high-frequency content (here, uniform noise)
+    adapter.resize_on_device = True
+    difference = (adapter.preprocess_image(image) - expected).abs().float()
+    assert difference.max() < 0.3  # i.e. about 20/255 per pixel (before normalization)
+    assert difference.mean() < 0.05
+
+
+@no_grad()
+@pytest.mark.parametrize("fine_grained", [False, True])
+def test_no_classifier_free_guidance(sd1_unet: SD1UNet, fine_grained: bool):
+    adapter = new_tiny_adapter(sd1_unet, fine_grained=fine_grained)
+    image_prompt = torch.randn(2, 3, 224, 224, device=sd1_unet.device, dtype=sd1_unet.dtype)
+    with_guidance = adapter.compute_clip_image_embedding(image_prompt)
+    without_guidance = adapter.compute_clip_image_embedding(image_prompt, classifier_free_guidance=False)
+    # only the negative embedding is skipped (note: the batch of image tokens is concatenated into one sequence)
+    assert with_guidance.shape[0] == 2 and without_guidance.shape[0] == 1
+    assert torch.allclose(without_guidance, with_guidance[1:], rtol=1e-2, atol=1e-2)
+
+
+def test_enable_tf32(sd1_unet: SD1UNet):
+    matmul, cudnn = torch.backends.cuda.matmul, torch.backends.cudnn
+    initial_flags = (matmul.allow_tf32, cudnn.allow_tf32)
+    matmul.allow_tf32 = cudnn.allow_tf32 = False
+    try:
+        adapter = SD1IPAdapter(
+            target=sd1_unet,
+            clip_image_encoder=TinyCLIPImageEncoder(device=sd1_unet.device, dtype=sd1_unet.dtype),
+            enable_tf32=True,
+        )
+        assert (matmul.allow_tf32, cudnn.allow_tf32) == (False, False)
+        adapter.inject()
+        assert (matmul.allow_tf32, cudnn.allow_tf32) == (True, True)
+        adapter.eject()
+        assert (matmul.allow_tf32, cudnn.allow_tf32) == (False, False)
+    finally:
+        matmul.allow_tf32, cudnn.allow_tf32 = initial_flags